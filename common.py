@@ -1,3 +1,4 @@
+import atexit
 import logging
 import sys
 from logging import FileHandler, StreamHandler
@@ -28,7 +29,8 @@ logger.addHandler(StreamHandler(sys.stdout))
 taskManager = TaskManager()
 searchEngine = ElasticSearchEngine("od-database")
 searchEngine.start_stats_scheduler()
-db = Database(config.DB_CONN_STR)
+db = Database(config.DB_CONN_STR, bcrypt_rounds=getattr(config, "BCRYPT_ROUNDS", 12))
+atexit.register(db.close)
 
 redis = r.Redis()
 
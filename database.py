@@ -1,9 +1,88 @@
+import logging
+import os
+import random
 import time
-import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from queue import Queue, Empty
+from threading import Thread
 from urllib.parse import urlparse
 
 import bcrypt
-import psycopg2
+from psycopg2 import DataError, IntegrityError
+from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
+
+logger = logging.getLogger("default")
+
+# Deferred writes (search log, website dates) are queued and written in batches by
+# a single thread per process, one transaction per kind of write. A batch is written
+# when it reaches WRITE_BATCH_SIZE or WRITE_INTERVAL seconds after its first write
+WRITE_BATCH_SIZE = 1000
+WRITE_INTERVAL = 1
+# Max number of rows in a single multi-row INSERT statement
+INSERT_CHUNK = 500
+# Only the first MAX_URL_LENGTH characters of an url are searched for parent directories
+MAX_URL_LENGTH = 2048
+
+# Hot queries, prepared once per connection and run with EXECUTE
+PREPARED_STATEMENTS = {
+    "get_website_by_url": "SELECT id, url, logged_ip, logged_useragent, last_modified FROM Website WHERE url=$1",
+    "get_website_by_id": "SELECT id, url, logged_ip, logged_useragent, last_modified FROM Website WHERE id=$1",
+    "check_api_token": "SELECT name FROM ApiClient WHERE token=$1 LIMIT 1",
+}
+
+INIT_SCRIPT = """
+DROP TABLE IF EXISTS Website, Admin, BlacklistedWebsite, ApiClient, SearchLogEntry;
+
+CREATE TABLE Website (
+
+  id SERIAL PRIMARY KEY NOT NULL,
+  url TEXT,
+  logged_ip TEXT,
+  logged_useragent TEXT,
+  last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE Admin (
+  username TEXT PRIMARY KEY NOT NULL,
+  password BYTEA,
+  role TEXT
+);
+
+CREATE TABLE BlacklistedWebsite (
+  id SERIAL PRIMARY KEY NOT NULL,
+  url TEXT
+);
+
+CREATE TABLE ApiClient (
+  name TEXT PRIMARY KEY NOT NULL,
+  token BYTEA NOT NULL
+);
+
+CREATE TABLE SearchLogEntry (
+  id SERIAL PRIMARY KEY,
+  search_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  remote_addr TEXT,
+  forwarded_for TEXT,
+  query TEXT,
+  extensions TEXT,
+  page INT,
+  blocked BOOLEAN DEFAULT FALSE,
+  results INT DEFAULT 0,
+  took INT DEFAULT 0
+);
+"""
+
+# Run on every startup, so that existing databases also get new indexes.
+# urls are only looked up by equality and have no length limit, so they use hash
+# indexes (btree entries are limited to ~2.7KB)
+INDEX_SCRIPT = """
+CREATE INDEX IF NOT EXISTS website_url ON Website USING hash (url);
+CREATE INDEX IF NOT EXISTS website_last_modified ON Website (last_modified, id);
+CREATE INDEX IF NOT EXISTS blacklistedwebsite_url ON BlacklistedWebsite USING hash (url);
+CREATE UNIQUE INDEX IF NOT EXISTS apiclient_token ON ApiClient (token);
+"""
 
 
 class BlacklistedWebsite:
@@ -29,59 +108,260 @@ class ApiClient:
         self.name = name
 
 
+def token_to_bytes(token):
+    """API tokens are stored as raw bytes and exposed as hex, dashes of old UUID tokens are ignored"""
+    try:
+        return bytes.fromhex(token.replace("-", ""))
+    except (AttributeError, ValueError):
+        return None
+
+
+class PreparedConnection(connection):
+    """Connection that remembers which PREPARED_STATEMENTS were prepared in its session"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
 class Database:
 
-    def __init__(self, db_conn_str):
+    def __init__(self, db_conn_str, min_conn=1, max_conn=32, bcrypt_rounds=12):
         self.db_conn_str = db_conn_str
+        self.bcrypt_rounds = bcrypt_rounds
         self.website_cache = dict()
         self.website_cache_time = 0
-
-        with psycopg2.connect(self.db_conn_str) as conn:
+        self.max_website_id = 0
+        self.max_website_id_time = 0
+
+        # Connections are kept open and shared between threads instead of
+        # reconnecting on every call. Each process keeps up to min_conn idle connections,
+        # this is kept low since scripts like mass_import.py fork many processes.
+        # Idle connections are not checked before use: after a PostgreSQL restart, the
+        # first call on each of them fails once and the broken connection is discarded
+        self._min_conn = min_conn
+        self._max_conn = max_conn
+        self._pools = dict()
+
+        self._write_queues = dict()
+        self._insert_sql = dict()
+
+        with self._get_conn() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_tables "
                            "WHERE tablename = 'searchlogentry')")
 
             if not cursor.fetchone()[0]:
                 self.init_database()
+            else:
+                self._upgrade_database(cursor)
+
+            cursor.execute(INDEX_SCRIPT)
+
+    def _get_pool(self):
+        """Connection pool of the current process, pools are keyed by pid"""
+        # After a fork (uWSGI workers, multiprocessing.Pool) the connections of the parent's pool
+        # share their sockets with the parent, so the child opens its own pool. The inherited pool
+        # stays referenced in self._pools: garbage collecting it would end the parent's sessions
+        pid = os.getpid()
+        pool = self._pools.get(pid)
+        if pool is None:
+            new_pool = ThreadedConnectionPool(self._min_conn, self._max_conn, self.db_conn_str,
+                                              connection_factory=PreparedConnection)
+            pool = self._pools.setdefault(pid, new_pool)
+            if pool is not new_pool:
+                new_pool.closeall()
+        return pool
+
+    @contextmanager
+    def _get_conn(self):
+        """Borrow a connection from the pool, the transaction is committed on exit (rolled back on error)"""
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+
+    @staticmethod
+    def _execute_prepared(cursor, name, args):
+
+        if name not in cursor.connection.prepared:
+            cursor.execute("PREPARE " + name + " AS " + PREPARED_STATEMENTS[name])
+            cursor.connection.prepared.add(name)
+
+        cursor.execute("EXECUTE " + name + " (" + ",".join(["%s"] * len(args)) + ")", args)
+
+    def close(self):
+        self.flush()
+        pool = self._pools.get(os.getpid())
+        if pool:
+            pool.closeall()
+
+    def _get_write_queue(self):
+        """Write queue of the current process, its writer thread is started on first use"""
+        # Like the connection pools, queues are keyed by pid: a forked process does not
+        # inherit the parent's writer thread
+        pid = os.getpid()
+        write_queue = self._write_queues.get(pid)
+        if write_queue is None:
+            new_queue = Queue()
+            write_queue = self._write_queues.setdefault(pid, new_queue)
+            if write_queue is new_queue:
+                writer_thread = Thread(target=self._writer_loop, args=(write_queue,))
+                writer_thread.setDaemon(True)
+                writer_thread.start()
+        return write_queue
+
+    def _writer_loop(self, write_queue):
+
+        while True:
+            batch = [write_queue.get()]
+
+            # Anything raised here is logged: if the thread died, the queue would never be consumed
+            try:
+                deadline = time.monotonic() + WRITE_INTERVAL
+                while len(batch) < WRITE_BATCH_SIZE:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(write_queue.get(timeout=remaining))
+                    except Empty:
+                        break
+
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error("Could not write %d queued writes: %s" % (len(batch), e))
+            finally:
+                for _ in batch:
+                    write_queue.task_done()
+
+    def _write_batch(self, batch):
+        """Group queued writes by write function and run each group once, in its own transaction"""
+        groups = defaultdict(list)
+        for write, args in batch:
+            groups[write].append(args)
+
+        for write, args_list in groups.items():
+            try:
+                self._write_group(write, args_list)
+            except (DataError, IntegrityError, ValueError) as e:
+                # Bad data (ValueError: e.g. NUL characters, rejected by psycopg2 before sending):
+                # retry one by one so that a single bad entry does not discard the whole group
+                logger.warning("Could not write %d queued writes, retrying one by one: %s" % (len(args_list), e))
+                for args in args_list:
+                    try:
+                        self._write_group(write, [args])
+                    except Exception as e:
+                        logger.error("Could not write queued write %s: %s" % (args, e))
+            except Exception as e:
+                # Connection errors would fail for every entry as well, drop the group
+                logger.error("Could not write %d queued writes, dropping them: %s" % (len(args_list), e))
+
+    def _write_group(self, write, args_list):
+
+        with self._get_conn() as conn:
+            write(conn.cursor(), args_list)
+
+    def flush(self):
+        """Wait until all writes queued by this process are done"""
+        write_queue = self._write_queues.get(os.getpid())
+        if write_queue:
+            write_queue.join()
+
+    def _write_search_logs(self, cursor, entries):
+        self._insert_many(cursor, "INSERT INTO SearchLogEntry "
+                                  "(remote_addr, forwarded_for, query, extensions, page, blocked, results, took, "
+                                  "search_time) VALUES {}",
+                          "(%s,%s,%s,%s,%s,%s,%s,%s,to_timestamp(%s))", entries)
+
+    @staticmethod
+    def _write_website_dates(cursor, website_ids):
+        cursor.execute("UPDATE Website SET last_modified=CURRENT_TIMESTAMP WHERE id = ANY(%s)",
+                       ([website_id for website_id, in website_ids],))
+
+    def _insert_many(self, cursor, insert, row, values) -> list:
+        """Insert values with up to INSERT_CHUNK rows per statement, returns the rows of a RETURNING clause"""
+        result = []
+
+        for i in range(0, len(values), INSERT_CHUNK):
+            chunk = values[i:i + INSERT_CHUNK]
+            cursor.execute(self._get_insert_sql(insert, row, len(chunk)), [v for r in chunk for v in r])
+            if cursor.description:
+                result.extend(cursor.fetchall())
+
+        return result
+
+    def _get_insert_sql(self, insert, row, row_count):
+        """Multi-row INSERT statement, cached by statement and row count"""
+        sql = self._insert_sql.get((insert, row_count))
+        if sql is None:
+            sql = insert.format(",".join([row] * row_count))
+            self._insert_sql[(insert, row_count)] = sql
+        return sql
 
     def init_database(self):
 
         print("Initializing database")
 
-        with open("init_script.sql", "r") as f:
-            init_script = f.read()
-
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cur = conn.cursor()
-            cur.execute(init_script)
+            cur.execute(INIT_SCRIPT)
 
-    def update_website_date_if_exists(self, website_id):
+    @staticmethod
+    def _upgrade_database(cursor):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
-            cursor = conn.cursor()
-            cursor.execute("UPDATE Website SET last_modified=CURRENT_TIMESTAMP WHERE id=%s", (website_id,))
-            conn.commit()
+        cursor.execute("SELECT data_type FROM information_schema.columns "
+                       "WHERE table_name = 'apiclient' AND column_name = 'token'")
+        token_type = cursor.fetchone()
+        if token_type and token_type[0] == "text":
+            print("Converting API tokens to BYTEA")
+            cursor.execute("ALTER TABLE ApiClient ALTER COLUMN token TYPE BYTEA "
+                           "USING decode(replace(token, '-', ''), 'hex')")
+
+    def update_website_date_if_exists(self, website_id):
+        self._get_write_queue().put((self._write_website_dates, (website_id,)))
 
     def insert_website(self, website: Website):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
-            cursor.execute("INSERT INTO Website (url, logged_ip, logged_useragent) VALUES (%s,%s,%s)",
+            cursor.execute("INSERT INTO Website (url, logged_ip, logged_useragent) VALUES (%s,%s,%s) RETURNING id",
                            (website.url, str(website.logged_ip), str(website.logged_useragent)))
-            cursor.execute("SELECT LAST_INSERT_ROWID()")
 
             website_id = cursor.fetchone()[0]
             conn.commit()
 
+        self.website_cache[website_id] = website.url
+        self.max_website_id = max(self.max_website_id, website_id)
         return website_id
 
+    def insert_websites(self, websites) -> list:
+        """Insert many websites in a single transaction, returns their ids in the same order"""
+        websites = list(websites)
+        if not websites:
+            return []
+
+        with self._get_conn() as conn:
+            cursor = conn.cursor()
+            website_ids = [r[0] for r in self._insert_many(
+                cursor, "INSERT INTO Website (url, logged_ip, logged_useragent) VALUES {} RETURNING id", "(%s,%s,%s)",
+                [(w.url, str(w.logged_ip), str(w.logged_useragent)) for w in websites])]
+            conn.commit()
+
+        for website, website_id in zip(websites, website_ids):
+            self.website_cache[website_id] = website.url
+        self.max_website_id = max(self.max_website_id, *website_ids)
+        return website_ids
+
     def get_website_by_url(self, url):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
-            cursor.execute("SELECT id, url, logged_ip, logged_useragent, last_modified FROM Website WHERE url=%s",
-                           (url,))
+            self._execute_prepared(cursor, "get_website_by_url", (url,))
             db_web = cursor.fetchone()
         if db_web:
             website = Website(db_web[1], db_web[2], db_web[3], db_web[4], str(db_web[0]))
@@ -91,10 +371,10 @@ class Database:
 
     def get_website_by_id(self, website_id):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
-            cursor.execute("SELECT * FROM Website WHERE id=%s", (website_id,))
+            self._execute_prepared(cursor, "get_website_by_id", (website_id,))
             db_web = cursor.fetchone()
 
             if db_web:
@@ -104,56 +384,91 @@ class Database:
             else:
                 return None
 
-    def get_websites(self, per_page, page: int, url):
-        """Get all websites"""
-        with psycopg2.connect(self.db_conn_str) as conn:
+    def get_websites(self, per_page, page: int, url, before=None):
+        """Get all websites, before is the (last_modified, id) of the last website of the previous page"""
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
-            cursor.execute("SELECT Website.id, Website.url, Website.last_modified FROM Website "
-                           "WHERE Website.url LIKE %s "
-                           "ORDER BY last_modified DESC LIMIT %s OFFSET %s", (url + "%", per_page, page * per_page))
+            if before:
+                # Keyset pagination: seek in the (last_modified, id) index instead of skipping rows
+                cursor.execute("SELECT Website.id, Website.url, Website.last_modified FROM Website "
+                               "WHERE Website.url LIKE %s AND (last_modified, id) < (%s, %s) "
+                               "ORDER BY last_modified DESC, id DESC LIMIT %s", (url + "%", *before, per_page))
+            else:
+                cursor.execute("SELECT Website.id, Website.url, Website.last_modified FROM Website "
+                               "WHERE Website.url LIKE %s "
+                               "ORDER BY last_modified DESC, id DESC LIMIT %s OFFSET %s",
+                               (url + "%", per_page, page * per_page))
 
             return cursor.fetchall()
 
     def get_random_website_id(self):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id FROM Website ORDER BY random() LIMIT 1")
+            if self.max_website_id_time + 120 < time.time():
+                cursor.execute("SELECT max(id) FROM Website")
+                self.max_website_id = cursor.fetchone()[0] or 0
+                self.max_website_id_time = time.time()
+
+            # Seek to a random id instead of sorting the whole table
+            cursor.execute("SELECT id FROM Website WHERE id >= %s ORDER BY id LIMIT 1",
+                           (random.randint(1, max(self.max_website_id, 1)),))
+            website_id = cursor.fetchone()
+            if not website_id:
+                cursor.execute("SELECT id FROM Website ORDER BY id LIMIT 1")
+                website_id = cursor.fetchone()
 
-            return cursor.fetchone()[0]
+            return website_id[0]
 
     def website_exists(self, url):
         """Check if an url or the parent directory of an url already exists"""
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
-            cursor.execute("SELECT id FROM Website WHERE url = substr(%s, 0, length(url) + 1)", (url,))
+            # Match the url and each of its parent directories so that the index on Website.url can be used
+            prefixes = [url[:i + 1] for i, c in enumerate(url[:MAX_URL_LENGTH]) if c == "/"]
+            prefixes.append(url)
+            cursor.execute("SELECT id FROM Website WHERE url = ANY(%s) LIMIT 1", (prefixes,))
             website_id = cursor.fetchone()
             return website_id[0] if website_id else None
 
     def delete_website(self, website_id):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
             cursor.execute("DELETE FROM Website WHERE id=%s", (website_id,))
             conn.commit()
 
+        self.website_cache.pop(website_id, None)
+
     def check_login(self, username, password) -> bool:
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
             cursor.execute("SELECT password FROM Admin WHERE username=%s", (username,))
 
             db_user = cursor.fetchone()
 
-            if db_user:
-                return bcrypt.checkpw(password.encode(), db_user[0].tobytes())
+        # Hash outside of the connection block, so that it goes back to the pool during the check
+        if not db_user:
+            return False
+        hashed_pw = db_user[0].tobytes()
+        if not bcrypt.checkpw(password.encode(), hashed_pw):
             return False
 
+        # Rehash passwords that were hashed with a different cost factor ($2b$<rounds>$...)
+        if int(hashed_pw[4:6]) != self.bcrypt_rounds:
+            with self._get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute("UPDATE Admin SET password=%s WHERE username=%s",
+                               (bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.bcrypt_rounds)), username))
+                conn.commit()
+        return True
+
     def get_user_role(self, username: str):
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
             cursor.execute("SELECT role FROM Admin WHERE username=%s", (username,))
@@ -166,10 +481,10 @@ class Database:
 
     def generate_login(self, username, password) -> None:
 
-        with psycopg2.connect(self.db_conn_str) as conn:
-            cursor = conn.cursor()
+        hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt(self.bcrypt_rounds))
 
-            hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt(12))
+        with self._get_conn() as conn:
+            cursor = conn.cursor()
 
             cursor.execute("INSERT INTO Admin (username, password, role) VALUES (%s,%s, 'admin')",
                            (username, hashed_pw))
@@ -177,54 +492,57 @@ class Database:
 
     def check_api_token(self, token) -> str:
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        token = token_to_bytes(token)
+        if not token:
+            return None
+
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
-            cursor.execute("SELECT name FROM ApiClient WHERE token=%s", (token,))
+            self._execute_prepared(cursor, "check_api_token", (token,))
             result = cursor.fetchone()
             return result[0] if result else None
 
     def generate_api_token(self, name: str) -> str:
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
-            token = str(uuid.uuid4())
+            token = os.urandom(16)
             cursor.execute("INSERT INTO ApiClient (token, name) VALUES (%s, %s)", (token, name))
             conn.commit()
 
-            return token
+            return token.hex()
 
     def get_tokens(self) -> list:
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
             cursor.execute("SELECT token, name FROM ApiClient")
 
-            return [ApiClient(x[0], x[1]) for x in cursor.fetchall()]
+            return [ApiClient(token.hex(), name) for token, name in cursor]
 
     def delete_token(self, token: str) -> None:
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
-            cursor.execute("DELETE FROM ApiClient WHERE token=%s", (token,))
+            cursor.execute("DELETE FROM ApiClient WHERE token=%s", (token_to_bytes(token),))
             conn.commit()
 
     def get_all_websites(self) -> dict:
+        """id -> url of all websites, refreshed every 2 minutes and kept up to date by insert/delete"""
         if self.website_cache_time + 120 < time.time():
-            with psycopg2.connect(self.db_conn_str) as conn:
-                cursor = conn.cursor()
+            with self._get_conn() as conn:
+                # Server-side cursor: rows are streamed in batches instead of
+                # materializing the whole table on the client first
+                cursor = conn.cursor("all_websites")
+                cursor.itersize = 10000
 
                 cursor.execute("SELECT id, url FROM Website")
 
-                result = dict()
-
-                for db_website in cursor.fetchall():
-                    result[db_website[0]] = db_website[1]
-
-                self.website_cache = result
+                self.website_cache = dict(cursor)
                 self.website_cache_time = time.time()
 
         return self.website_cache
@@ -234,10 +552,7 @@ class Database:
         websites = self.get_all_websites()
 
         for hit in page["hits"]["hits"]:
-            if hit["_source"]["website_id"] in websites:
-                hit["_source"]["website_url"] = websites[hit["_source"]["website_id"]]
-            else:
-                hit["_source"]["website_url"] = "[DELETED]"
+            hit["_source"]["website_url"] = websites.get(hit["_source"]["website_id"], "[DELETED]")
 
         return page
 
@@ -246,11 +561,7 @@ class Database:
         websites = self.get_all_websites()
 
         for doc in docs:
-            if doc["_source"]["website_id"] in websites:
-                doc["_source"]["website_url"] = websites[doc["_source"]["website_id"]]
-            else:
-                doc["_source"]["website_url"] = "[DELETED]"
-
+            doc["_source"]["website_url"] = websites.get(doc["_source"]["website_id"], "[DELETED]")
             yield doc
 
     def join_website_on_stats(self, stats):
@@ -262,7 +573,7 @@ class Database:
 
     def add_blacklist_website(self, url):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
             parsed_url = urlparse(url)
             url = parsed_url.scheme + "://" + parsed_url.netloc
@@ -271,7 +582,7 @@ class Database:
 
     def remove_blacklist_website(self, blacklist_id):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
             cursor.execute("DELETE FROM BlacklistedWebsite WHERE id=%s", (blacklist_id,))
@@ -279,49 +590,40 @@ class Database:
 
     def is_blacklisted(self, url):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
             parsed_url = urlparse(url)
             url = parsed_url.scheme + "://" + parsed_url.netloc
-            print(url)
-            cursor.execute("SELECT id FROM BlacklistedWebsite WHERE url LIKE %s LIMIT 1", (url,))
+            cursor.execute("SELECT 1 FROM BlacklistedWebsite WHERE url=%s LIMIT 1", (url,))
 
             return cursor.fetchone() is not None
 
     def get_blacklist(self):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
-            cursor.execute("SELECT * FROM BlacklistedWebsite")
-            return [BlacklistedWebsite(r[0], r[1]) for r in cursor.fetchall()]
+            cursor.execute("SELECT id, url FROM BlacklistedWebsite")
+            return [BlacklistedWebsite(blacklist_id, url) for blacklist_id, url in cursor]
 
     def log_search(self, remote_addr, forwarded_for, q, exts, page, blocked, results, took):
-
-        with psycopg2.connect(self.db_conn_str) as conn:
-            cursor = conn.cursor()
-
-            cursor.execute(
-                "INSERT INTO SearchLogEntry "
-                "(remote_addr, forwarded_for, query, extensions, page, blocked, results, took) "
-                "VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                (remote_addr, forwarded_for, q, ",".join(exts), page, blocked, results, took))
-
-            conn.commit()
+        self._get_write_queue().put((self._write_search_logs,
+                                     (remote_addr, forwarded_for, q, ",".join(exts), page, blocked, results, took,
+                                      time.time())))
 
     def get_oldest_updated_websites(self, size: int, prefix: str):
 
-        with psycopg2.connect(self.db_conn_str) as conn:
+        with self._get_conn() as conn:
             cursor = conn.cursor()
 
             cursor.execute("SELECT id, url, last_modified FROM website "
                            "WHERE url LIKE %s "
                            "ORDER BY last_modified ASC LIMIT %s",
                            (prefix + "%", size, ))
-            return [Website(url=r[1],
-                            website_id=r[0],
-                            last_modified=r[2],
+            return [Website(url=url,
+                            website_id=website_id,
+                            last_modified=last_modified,
                             logged_ip=None,
                             logged_useragent=None
                             )
-                    for r in cursor.fetchall()]
+                    for website_id, url, last_modified in cursor]
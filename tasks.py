@@ -1,3 +1,4 @@
+import atexit
 import json
 import logging
 import os
@@ -62,6 +63,7 @@ class TaskManager:
     def __init__(self):
         self.search = ElasticSearchEngine("od-database")
         self.db = database.Database(config.DB_CONN_STR)
+        atexit.register(self.db.close)
         self.tracker = TaskTrackerApi(config.TT_API)
 
         self.worker = Worker.from_file(self.tracker)
@@ -1,5 +1,6 @@
 import json
 import os
+from datetime import datetime
 from multiprocessing.pool import Pool
 from urllib.parse import urlparse
 
@@ -107,8 +108,13 @@ def setup_views(app):
         else:
             search_term = url
 
+        try:
+            before = (datetime.fromisoformat(request.args["before"]), int(request.args["before_id"]))
+        except (KeyError, ValueError):
+            before = None
+
         return render_template("websites.html",
-                               websites=db.get_websites(50, page, search_term),
+                               websites=db.get_websites(50, page, search_term, before),
                                p=page, url=search_term, per_page=50)
 
     @app.route("/website/random")